@@ -1,123 +1,164 @@
 """
 A module for converting CSV text into a 2d list of strings and vice versa.
 
-To convert CSV to Python, use the parse_csv function. To convert Python to CSV, use the strs_to_csv function.
+To convert CSV to Python, use the parse_csv function (or iter_csv_rows to get one row at a time). To convert Python to CSV, use the strs_to_csv function.
 """
 
 from __future__ import annotations
-from typing import Tuple
-
-def parse_csv(csv: str, quote_char: str = '"', comma_char: str = ',', new_line_char: str = '\n') -> list[list[str]]:
+from typing import Iterator, Tuple
+from functools import lru_cache
+import mmap
+import re
+
+# States of the CSV scanner
+# Outside of quotes, i.e. at the start of a cell or inside of a cell that did not start with a quote
+_UNQUOTED = 0
+# Inside of a quoted cell
+_IN_QUOTED = 1
+# Inside of a quoted cell, directly after a quote that may close the cell or escape another quote
+_AFTER_QUOTE = 2
+
+@lru_cache(maxsize=None)
+def _structural_char_regex(quote_char: str | bytes, comma_char: str | bytes, new_line_char: str | bytes) -> re.Pattern:
+    """Returns a compiled regex that matches any of the given quote, comma, or newline characters."""
+    chars = re.escape(quote_char + comma_char + new_line_char)
+    return re.compile(b'[' + chars + b']' if isinstance(chars, bytes) else '[' + chars + ']')
+
+def parse_csv(csv: str | bytes | bytearray | mmap.mmap, quote_char: str = '"', comma_char: str = ',', new_line_char: str = '\n') -> list[list[str]]:
     """
     Takes in the contents of a CSV file as a string and returns its parsed contents as a 2d array of strings.
+    The contents can also be given as UTF-8 encoded bytes (see iter_csv_rows).
+    """
+    return list(iter_csv_rows(csv, quote_char, comma_char, new_line_char))
+
+def iter_csv_rows(csv: str | bytes | bytearray | mmap.mmap, quote_char: str = '"', comma_char: str = ',', new_line_char: str = '\n') -> Iterator[list[str]]:
+    """
+    Takes in the contents of a CSV file as a string and yields its parsed rows one at a time as lists of strings,
+    so that the rows don't all have to be kept in memory at once.
+    Syntax errors are raised once the iteration reaches them.
+
+    The contents can also be given as bytes, a bytearray, or an mmap holding UTF-8 encoded text,
+    in which case only the cells are decoded and positions in error messages are byte offsets.
+    This lets large files be parsed straight from an mmap without decoding them into one big string first.
+    The quote, comma, and new line characters have to be ASCII characters in that case.
+    """
+    if isinstance(csv, str):
+        pattern = _structural_char_regex(quote_char, comma_char, new_line_char)
+        return _iter_csv_rows(csv, pattern, quote_char, new_line_char, quote_char)
+    if not isinstance(csv, (bytes, bytearray, mmap.mmap)):
+        raise TypeError(f"Argument 'csv' must be a str, bytes, bytearray, or mmap, not '{type(csv).__name__}'")
+
+    special_chars = (quote_char + comma_char + new_line_char).encode('utf-8')
+    if len(special_chars) != 3:
+        raise ValueError("The quote, comma, and new line characters must be single ASCII characters when parsing bytes")
+    pattern = _structural_char_regex(special_chars[0:1], special_chars[1:2], special_chars[2:3])
+    # indexing bytes gives ints, so the characters are compared as ints as well
+    rows = _iter_csv_rows(csv, pattern, special_chars[0], special_chars[2], special_chars[0:1])
+    return ([cell.decode('utf-8') for cell in row] for row in rows)
+
+def _iter_csv_rows(csv: str | bytes | bytearray | mmap.mmap, pattern: re.Pattern, quote_char: str | int, new_line_char: str | int, quote: str | bytes) -> Iterator[list]:
+    """
+    Implementation of iter_csv_rows for both strings and bytes, bytearrays, or mmaps.
+    `pattern` matches the quote, comma, and new line characters, `quote_char` and `new_line_char` are
+    the values that indexing `csv` gives for those characters, and `quote` is the quote character as a str or bytes
+    (like `csv`), which is escaped by doubling it in quoted cells.
     """
-    # List of all rows
-    lines = []
     # List of strings representing the current row being parsed
     current_row = []
-    
-    # Whether or not the cursor is inside a cell
-    out_of_cell = True
+    # Bound method looked up once instead of once per cell
+    append_cell = current_row.append
+    escaped_quote = quote + quote
+    # Number of completed rows (used for error messages)
+    row_count = 0
+
+    state = _UNQUOTED
     # The index of the start of the current cell
     cell_start_ind = 0
-    # Whether or not the cell started with a quote
-    cell_is_quoted = False
-    # True if the last character was a quote and was not the start of a quoted cell
-    last_was_quote = False
+    # The index of the last quote seen while in the _AFTER_QUOTE state
+    quote_ind = -1
 
-    # Iterates over each character in the CSV string
-    for i in range(len(csv)):
+    # Only quotes, commas, and newlines can change the state, so the characters in between are skipped
+    # by the regex engine instead of being looked at one by one
+    for i in map(re.Match.start, pattern.finditer(csv)):
         c = csv[i]
-        # Whether or not the current character is a possible cell end character
-        could_be_cell_end = (c == comma_char or c == new_line_char)
-
-        # Update state to be inside of a cell
-        if out_of_cell:
-            out_of_cell = False
-            cell_start_ind = i
-            last_was_quote = False
-            cell_is_quoted = c == quote_char
-            # if check is necessary so that empty cells (e.g. `,,`) can be parsed correctly
-            if not could_be_cell_end:
-                continue
-
-        # Syntax check to make sure that quotes are not included in unquoted cells
-        if not cell_is_quoted and c == quote_char:
-            (line, col) = get_line_and_col(csv, i)
-            raise SyntaxError(f"Unexpected quote in CSV at position {i} (row: {len(lines)}, cell: {len(current_row)}, line: {line}, col: {col})")
 
-        # Handle double-quote escaping
-        if cell_is_quoted and last_was_quote and not could_be_cell_end:
+        # Inside of quotes, only another quote can change the state
+        if state == _IN_QUOTED:
             if c == quote_char:
-                last_was_quote = False
-                continue
-            else:
-                # Throw on single quotes not followed by a newline, comma, or end of file
-                (line, col) = get_line_and_col(csv, i)
-                raise SyntaxError(f"Expected comma, new line, or quote following another quote at position {i} (row: {len(lines)}, cell: {len(current_row)}, line: {line}, col: {col})")
-        # End cell
-        if (last_was_quote if cell_is_quoted else True) and could_be_cell_end:
-            out_of_cell = True
-            last_was_quote = False
+                state = _AFTER_QUOTE
+                quote_ind = i
+            continue
 
-            # Grab cell text
-            cell_text = csv[cell_start_ind : i]
-            # Unescape cell if necessary
-            if cell_is_quoted:
-                cell_text = unescape_csv_cell(cell_text)
+        # Throw on single quotes not followed by a newline, comma, or end of file
+        if state == _AFTER_QUOTE and i != quote_ind + 1:
+            i = quote_ind + 1
+            (line, col) = get_line_and_col(csv, i)
+            raise SyntaxError(f"Expected comma, new line, or quote following another quote at position {i} (row: {row_count}, cell: {len(current_row)}, line: {line}, col: {col})")
 
-            current_row.append(cell_text)
+        # End cell
+        if c != quote_char:
+            if state == _AFTER_QUOTE:
+                # Unescape quoted cell (inlined unescape_csv_cell, which skips the replace if nothing is escaped)
+                cell_text = csv[cell_start_ind + 1 : i - 1]
+                append_cell(cell_text.replace(escaped_quote, quote) if escaped_quote in cell_text else cell_text)
+            else:
+                append_cell(csv[cell_start_ind : i])
             # If the cell ends on a newline, not a comma, end current row
             if c == new_line_char:
-                lines.append(current_row)
+                yield current_row
+                row_count += 1
                 current_row = []
-            cell_is_quoted = False
-            continue
-
-        # Part of double-quote escaping handling
-        if cell_is_quoted and c == quote_char:
-            last_was_quote = True
+                append_cell = current_row.append
+            state = _UNQUOTED
+            cell_start_ind = i + 1
+        # A quote either starts a quoted cell or, directly following another quote, escapes it
+        elif state == _AFTER_QUOTE or i == cell_start_ind:
+            state = _IN_QUOTED
         else:
-            last_was_quote = False
+            # Syntax check to make sure that quotes are not included in unquoted cells
+            (line, col) = get_line_and_col(csv, i)
+            raise SyntaxError(f"Unexpected quote in CSV at position {i} (row: {row_count}, cell: {len(current_row)}, line: {line}, col: {col})")
 
     # Handle trailing cells
-    if cell_is_quoted:
+    n = len(csv)
+    if state == _IN_QUOTED:
+        raise SyntaxError(f"Unexpected end of input in CSV, expected quote at position {n} (End Of File)")
+    elif state == _AFTER_QUOTE:
+        if quote_ind != n - 1:
+            i = quote_ind + 1
+            (line, col) = get_line_and_col(csv, i)
+            raise SyntaxError(f"Expected comma, new line, or quote following another quote at position {i} (row: {row_count}, cell: {len(current_row)}, line: {line}, col: {col})")
         # quoted cells
-        if last_was_quote:
-            current_row.append(unescape_csv_cell(csv[cell_start_ind:]))
-        else:
-            raise SyntaxError(f"Unexpected end of input in CSV, expected quote at position {len(csv)} (End Of File)")
-    elif not out_of_cell:
-        # unquoted cells
-        current_row.append(csv[cell_start_ind:])
-    elif csv.endswith(comma_char):
-        # empty cells
-        current_row.append('')
-
-    # If the current row list has elements in it, add it to the lines list
-    if len(current_row):
-        lines.append(current_row)
+        cell_text = csv[cell_start_ind + 1 : -1]
+        append_cell(cell_text.replace(escaped_quote, quote) if escaped_quote in cell_text else cell_text)
+    elif cell_start_ind < n or current_row:
+        # unquoted cells, and empty cells if the input ended with a comma
+        append_cell(csv[cell_start_ind:])
 
-    return lines
+    # If the current row list has elements in it, yield it as the last row
+    if current_row:
+        yield current_row
 
-def unescape_csv_cell(cell: str):
+def unescape_csv_cell(cell: str) -> str:
     """
-    Converts a single, escaped CSV cell to plain, unescaped text
+    Converts a single, escaped CSV cell (including its surrounding quotes) to plain, unescaped text
     """
-    return cell.strip('"').replace('""', '"')
+    # only the surrounding quotes are removed; strip('"') would also remove escaped quotes at either end
+    return cell[1:-1].replace('""', '"')
 
-def get_line_and_col(text: str, index: int) -> Tuple[int, int]:
+def get_line_and_col(text: str | bytes | bytearray | mmap.mmap, index: int) -> Tuple[int, int]:
     """
-    Takes in a string and an index and returns the line and column (zero-indexed)
+    Takes in a string (or bytes, bytearray, or mmap) and an index and returns the line and column (zero-indexed)
     referenced by the index parameter, in the form (line, col)
     """
-    line_count = 0
-    last_line_index = 0
-    for i in range(0, index):
-        if text[i] == '\n':
-            line_count += 1
-            last_line_index = i
-    return (line_count, index - last_line_index)
+    if isinstance(text, str):
+        new_line = '\n'
+    else:
+        # mmap doesn't have a count method, but its slices (bytes) do
+        (text, new_line) = (bytes(text[:index]), b'\n')
+    line_count = text.count(new_line, 0, index)
+    last_line_index = text.rfind(new_line, 0, index)
+    return (line_count, index - (last_line_index + 1))
 
 # Encoding CSV
 
@@ -125,7 +166,11 @@ def strs_to_csv(csv: list[list[str]], quote_char: str = '"', comma_char: str = '
     """
     Escapes and formats the given 2d list of strings into the CSV format.
     """
-    rows = [comma_char.join([str_to_csv(cell, quote_char, comma_char, new_line_char) for cell in row]) for row in csv]
+    # the check from str_to_csv is inlined so that cells which don't need quotes don't cost a function call
+    rows = (comma_char.join([
+        quote_csv_cell(cell) if quote_char in cell or comma_char in cell or new_line_char in cell else cell
+        for cell in row
+    ]) for row in csv)
     return new_line_char.join(rows)
 
 def str_to_csv(csv: str, quote_char: str, comma_char: str, new_line_char: str) -> str:
@@ -135,5 +180,11 @@ def str_to_csv(csv: str, quote_char: str, comma_char: str, new_line_char: str) -
     comma, or newline character.
     """
     if quote_char in csv or comma_char in csv or new_line_char in csv:
-        csv = '"' + csv.replace('"', '""') + '"'
+        csv = quote_csv_cell(csv)
     return csv
+
+def quote_csv_cell(cell: str) -> str:
+    """
+    Wraps a single string with quotes and escapes the quotes inside of it
+    """
+    return '"' + cell.replace('"', '""') + '"'
@@ -1,33 +1,91 @@
 """
 A module for converting JSON to Python objects and Python objects to JSON.
 Use the methods parse_json and to_json to do this.
+parse_json_strict is a pure-Python alternative to parse_json that produces the same values.
 
 Note that to_json can only convert dict, list, str, int, float, bool, and None values.
 """
 
 from __future__ import annotations
 from typing import Tuple
+from functools import lru_cache
+from json import loads as _json_loads, JSONDecodeError as _JSONDecodeError
 import math
+import re
+import sys
 
 # JSON -> Py
 
-JSON_WHITESPACE = (' ', '\t', '\r', '\n')
-JSON_NUM_START_CHARS = ('0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-')
-JSON_NUM_CHARS = ('0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.', 'e', 'E', '+', '-')
-
-def parse_json(json: str) -> dict | list | str | float | bool | None:
+# Character sets are frozensets so that membership tests are hash lookups instead of linear scans
+JSON_WHITESPACE = frozenset(' \t\r\n')
+JSON_NUM_START_CHARS = frozenset('0123456789-')
+JSON_NUM_CHARS = frozenset('0123456789.eE+-')
+JSON_HEX_CHARS = frozenset('0123456789abcdefABCDEF')
+# Escape sequences (other than '\\u') and the characters they represent
+JSON_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 't': '\t', 'r': '\r', '/': '/', '"': '"', '\\': '\\'}
+_JSON_NUM_RE = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?')
+_JSON_WHITESPACE_RE = re.compile(r'[ \t\r\n]*')
+# Characters that interrupt a run of plain characters in a string: the closing quote,
+# the start of an escape sequence, and control characters (which must be escaped)
+_JSON_STR_SPECIAL_RE = re.compile(r'["\\\x00-\x1f]')
+# An escaped low surrogate (\uDC00-\uDFFF), which forms a surrogate pair if it directly follows an escaped high surrogate
+_JSON_LOW_SURROGATE_ESCAPE_RE = re.compile(r'\\u[dD][c-fC-F][0-9a-fA-F]{2}')
+
+def parse_json(json: str) -> dict | list | str | int | float | bool | None:
     """Parses a JSON string into Python values.
 
     JSON Type => Python Type \n
     `object`   =>   `dict`   \n
     `array`    =>   `list`   \n
-    `number`   =>   `float`  \n
+    `number`   =>   `int` or `float` \n
     `string`   =>   `str`    \n
     `boolean`  =>   `bool`   \n
     `null`     =>   `None`
 
+    Uses the C-accelerated parser from the standard library's `json` module.
+    See `parse_json_strict` for this module's own (much slower) parser, which produces the same values.
+
     >>> parse_json('{"a": null, "b": [1, true, "a\\\\nb"]}')
-    {'a': None, 'b': [1.0, True, 'a\\nb']}
+    {'a': None, 'b': [1, True, 'a\\nb']}
+    """
+    try:
+        try:
+            return _json_loads(json, parse_constant=_reject_json_constant)
+        except _JSONDecodeError:
+            raise
+        except ValueError:
+            # an integer had too many digits for int() (see sys.set_int_max_str_digits), so parse again
+            # with the slower fallback for those (only done here to keep the common case fast)
+            return _json_loads(json, parse_constant=_reject_json_constant, parse_int=_parse_json_int)
+    except _InvalidJSONConstant:
+        # json.loads doesn't say where the constant is, but parse_json_strict rejects it with a positioned error
+        return parse_json_strict(json)
+    except _JSONDecodeError as err:
+        # the json module already worked out the (one-indexed) line and column, so the text doesn't need to be scanned again.
+        # Some of its messages already end with 'at' (e.g. "Unterminated string starting at"), which is dropped here.
+        message = err.msg.removesuffix(' at')
+        raise SyntaxError(f"{message} at position {err.pos} (line: {err.lineno - 1}, column: {err.colno - 1})") from None
+
+def _parse_json_int(num: str) -> int | float:
+    # integers with more digits than int() allows are converted to floats instead
+    try:
+        return int(num)
+    except ValueError:
+        return float(num)
+
+class _InvalidJSONConstant(Exception):
+    """Raised by json.loads (through _reject_json_constant) for NaN and (-)Infinity."""
+
+def _reject_json_constant(name: str):
+    # the json module accepts NaN and (-)Infinity by default, which aren't part of the JSON spec
+    raise _InvalidJSONConstant(name)
+
+def parse_json_strict(json: str) -> dict | list | str | int | float | bool | None:
+    """Parses a JSON string into Python values the same way as `parse_json`,
+    but uses this module's own pure-Python parser instead of the `json` module.
+
+    >>> parse_json_strict('{"a": null, "b": [1, true, "a\\\\nb"]}')
+    {'a': None, 'b': [1, True, 'a\\nb']}
     """
     (parsed, i) = parse_json_base(json)
     i = skip_whitespace(json, i)
@@ -41,85 +99,80 @@ def format_err_str(message: str, text: str, index: int) -> str:
     Intended to be used to give positional error messages when dealing with a document.
     Both `$line_count$` and `$column$` are zero-indexed.
     """
-    line_count = 0
-    last_line_index = 0
-    for i in range(0, index):
-        if text[i] == '\n':
-            line_count += 1
-            last_line_index = i
-
-    return message.replace("$position$", f"{index} (line: {line_count}, column: {index - last_line_index})")
-
-def parse_json_base(json: str, i: int = 0) -> Tuple[dict | list | str | float | bool | None, int]:
-    i = skip_whitespace(json, i)
-    if i >= len(json):
-        raise SyntaxError(f"Unexpected end of file at position {len(json)}")
-
-    c = json[i]
-    if c == '{': return parse_json_obj(json, i)
-    elif c == '[': return parse_json_arr(json, i)
-    elif c == '"': return parse_json_str(json, i)
-    elif c == 'n': return parse_json_null(json, i)
-    elif c == 't' or c == 'f': return parse_json_boolean(json, i)
-    elif c in JSON_NUM_START_CHARS: return parse_json_number(json, i)
-    else:
-        raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$", json, i))
-
-def parse_json_obj(json: str, i: int) -> Tuple[dict, int]:
-    if json[i] != '{':
-        raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected '{'{'}'", json, i))
-    i += 1
-    i = skip_whitespace(json, i)
-    obj = dict()
+    line_count = text.count('\n', 0, index)
+    column = index - (text.rfind('\n', 0, index) + 1)
+    return message.replace("$position$", f"{index} (line: {line_count}, column: {column})")
+
+def parse_json_base(json: str, i: int = 0) -> Tuple[dict | list | str | int | float | bool | None, int]:
+    # Objects and arrays are tracked on a stack instead of being parsed recursively, so that deeply nested
+    # documents don't hit the recursion limit. Each item is a [container, key] list for an object or array
+    # that is still being parsed, where key is the key of the next value in an object (or None in an array).
+    stack = []
     try:
-        if json[i] == '}':
-            return (obj, i + 1)
         while True:
-            (key, i) = parse_json_str(json, i)
-            i = skip_whitespace(json, i)
-            if json[i] != ':':
-                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected ':'", json, i))
-            i += 1
-            i = skip_whitespace(json, i)
-            (val, i) = parse_json_base(json, i)
-            obj[key] = val
             i = skip_whitespace(json, i)
+            if i >= len(json):
+                raise SyntaxError(f"Unexpected end of file at position {len(json)}")
+
             c = json[i]
-            if c == '}':
-                i += 1
-                break
-            elif c != ',':
-                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected ',' or '{'}'}'", json, i))
-            i += 1
-            i = skip_whitespace(json, i)
+            if c == '{':
+                i = skip_whitespace(json, i + 1)
+                if json[i] == '}':
+                    (val, i) = ({}, i + 1)
+                else:
+                    (key, i) = parse_json_key(json, i)
+                    stack.append([{}, key])
+                    continue
+            elif c == '[':
+                i = skip_whitespace(json, i + 1)
+                if json[i] == ']':
+                    (val, i) = ([], i + 1)
+                else:
+                    stack.append([[], None])
+                    continue
+            elif c == '"': (val, i) = parse_json_str(json, i)
+            elif c == 'n': (val, i) = parse_json_null(json, i)
+            elif c == 't' or c == 'f': (val, i) = parse_json_boolean(json, i)
+            elif c in JSON_NUM_START_CHARS: (val, i) = parse_json_number(json, i)
+            else:
+                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$", json, i))
+
+            # Add the value to the enclosing object or array, and keep going outwards for as long as they end
+            while True:
+                if not stack:
+                    return (val, i)
+                frame = stack[-1]
+                (container, key) = frame
+                if key is None:
+                    container.append(val)
+                else:
+                    container[key] = val
+                i = skip_whitespace(json, i)
+                c = json[i]
+                if c == ',':
+                    # another value follows
+                    i = skip_whitespace(json, i + 1)
+                    if key is not None:
+                        (key, i) = parse_json_key(json, i)
+                        frame[1] = key
+                    break
+                end_char = ']' if key is None else '}'
+                if c != end_char:
+                    raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected ',' or '{end_char}'", json, i))
+                (val, i) = (container, i + 1)
+                stack.pop()
     except IndexError:
         raise SyntaxError(f"Unexpected end of file at position {len(json)}")
-    return (obj, i)
 
-def parse_json_arr(json: str, i: int) -> Tuple[list, int]:
-    if json[i] != '[':
-        raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected '['", json, i))
-    i += 1
+def parse_json_key(json: str, i: int) -> Tuple[str, int]:
+    """Parses an object key and the ':' following it, and returns the key and the position after the ':'."""
+    (key, i) = parse_json_str(json, i)
+    # keys tend to repeat across objects, so share one string object per distinct key
+    key = sys.intern(key)
     i = skip_whitespace(json, i)
-    arr = list()
-    try:
-        if json[i] == ']':
-            return (arr, i + 1)
-        while True:
-            (val, i) = parse_json_base(json, i)
-            arr.append(val)
-            i = skip_whitespace(json, i)
-            c = json[i]
-            if c == ']':
-                i += 1
-                break
-            elif c != ',':
-                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected ',' or ']'", json, i))
-            i += 1
-            i = skip_whitespace(json, i)
-    except IndexError:
-        raise SyntaxError(f"Unexpected end of file at position {len(json)}")
-    return (arr, i)
+    if json[i] != ':':
+        raise SyntaxError(format_err_str(f"Unexpected character '{json[i]}' at position $position$. Expected ':'", json, i))
+    return (key, i + 1)
 
 def parse_json_null(json: str, i: int) -> Tuple[None, int]:
     if not json.startswith('null', i):
@@ -135,134 +188,129 @@ def parse_json_str(json: str, i: int) -> Tuple[str, int]:
     if json[i] != '"':
         raise SyntaxError(format_err_str(f"Unexpected character '{json[i]}' at position $position$. Expected '\"'", json, i))
     i += 1
-    last_was_esc = False
     char_list = []
-    hex_char_str = None
     try:
         while True:
+            # copy the run of plain characters up to the next quote, backslash, or control character as one slice
+            match = _JSON_STR_SPECIAL_RE.search(json, i)
+            if match is None:
+                raise IndexError
+            end = match.start()
+            if end != i:
+                char_list.append(json[i:end])
             # current character
-            c = json[i]
-            i += 1
-            # if in hexadecimal escape, use different logic
-            if hex_char_str is not None:
-                l = c.lower()
-                if '0' <= l and '9' >= l or 'a' <= l and 'f' >= l:
-                    hex_char_str += l
-                else:
-                    raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected a hexadecimal character ([0-9A-Fa-f])", json, i))
-                if len(hex_char_str) == 4:
-                    char_list.append(chr(int(hex_char_str, 16)))
-                    hex_char_str = None
-                continue
-            if c == '"' and not last_was_esc:
+            c = json[end]
+            i = end + 1
+            if c == '"':
                 break
 
-            if last_was_esc:
-                # unescaped character sequence to append
-                s = ''
-                if c == 'b': s = '\b'
-                elif c == 'f': s = '\f'
-                elif c == 'n': s = '\n'
-                elif c == 't': s = '\t'
-                elif c == 'r': s = '\r'
-                elif c == '/': s = '/'
-                elif c == '"': s = '"'
-                elif c == '\\': s = '\\'
-                elif c == 'u': hex_char_str = ''
-                else:
-                    raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected 'b', 'f', 'n', 't', 'r', '/', '\\', or 'u'", json, i))
-                if s: char_list.append(s)
-                last_was_esc = False
-                continue
-            
-            if c == '\\':
-                last_was_esc = True
-                continue
-            # %x20-21 / %x23-5B / %x5D-10FFFF
-            if not (c >= '\x20' and c <= '\x21' or c >= '\x23' and c <= '\x5b' or c >= '\x5d' and c <= '\U0010ffff'):
+            if c != '\\':
+                # %x20-21 / %x23-5B / %x5D-10FFFF
                 raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected a character in the following ranges: %x20-21 / %x23-5B / %x5D-10FFFF", json, i))
-            char_list.append(c)
+
+            # escaped character
+            c = json[i]
+            i += 1
+            if c == 'u':
+                # hexadecimal escape
+                for _ in range(4):
+                    l = json[i]
+                    i += 1
+                    if l not in JSON_HEX_CHARS:
+                        raise SyntaxError(format_err_str(f"Unexpected character '{l}' at position $position$. Expected a hexadecimal character ([0-9A-Fa-f])", json, i))
+                code = int(json[i - 4 : i], 16)
+                # a high surrogate directly followed by an escaped low surrogate is a surrogate pair,
+                # which encodes a single character outside of the Basic Multilingual Plane
+                if 0xd800 <= code <= 0xdbff and _JSON_LOW_SURROGATE_ESCAPE_RE.match(json, i) is not None:
+                    low = int(json[i + 2 : i + 6], 16)
+                    code = 0x10000 + ((code - 0xd800) << 10) + (low - 0xdc00)
+                    i += 6
+                char_list.append(chr(code))
+            elif c in JSON_ESCAPES:
+                char_list.append(JSON_ESCAPES[c])
+            else:
+                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected 'b', 'f', 'n', 't', 'r', '/', '\\', or 'u'", json, i))
     except IndexError:
         raise SyntaxError(f"Unexpected end of file at position {len(json)}")
     return (''.join(char_list), i)
 
-def parse_json_number(json: str, i: int) -> Tuple[float, int]:
-    ind = i
-    while ind < len(json) and json[ind] in JSON_NUM_CHARS:
-        ind += 1
-    num = json[i:ind]
-    negative = num.startswith('-')
-    if len(num) == 0:
-        raise SyntaxError(format_err_str(f"Unexpected empty number string at position $position$.", json, i))
-    if negative:
-        num = num[1:]
-        i += 1
-    if num.startswith('.'):
-        raise SyntaxError(format_err_str(f"Unexpected decimal point at position $position$. Expected a digit beforehand", json, i))
-    if len(num) >= 2 and num[0] == '0' and num[1] >= '0' and num[1] <= '9':
-        raise SyntaxError(format_err_str(f"Unexpected digit following a zero at position $position$. Expected '.', 'e', 'E', or end of number", json, i + 1))
-
-    reached_dec = False
-    e_index = num.lower().index('e') if 'e' in num.lower() else len(num)
-    before_e = num[:e_index]
-    if before_e.endswith('.'):
-        raise SyntaxError(format_err_str(f"Unexpected decimal point at position $position$. Expected no decimal point or a following digit", json, i + len(before_e) - 1))
-    if len(before_e) == 0:
-        raise SyntaxError(format_err_str(f"Unexpected end of non-exponent segment of number at $position$. Expected digits preceding exponent separator ('e' or 'E')", json, i))
-
-    for c in before_e:
-        if c == '.':
-            if reached_dec:
-                raise SyntaxError(format_err_str(f"Unexpected second decimal point at position $position$. Expected 0 or 1 decimal points", json, i))
-            reached_dec = True
-            i += 1
-            continue
-        if c < '0' or c > '9':
-            raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected a digit", json, i))
-
-    if e_index != len(num):
-        i = e_index + 1
-        after_e = num[e_index + 1:]
-        if after_e.startswith('+') or after_e.startswith('-'):
-            after_e = after_e[1:]
-            i += 1
-        if len(after_e) == 0:
-            raise SyntaxError(format_err_str(f"Unexpected end of number at position $position$. Expected a digit", json, i))
-
-        for c in after_e:
-            if c < '0' or c > '9':
-                raise SyntaxError(format_err_str(f"Unexpected character '{c}' at position $position$. Expected a digit", json, i))
-            i += 1
-    if negative: num = '-' + num
-    return (float(num), ind)
+def parse_json_number(json: str, i: int) -> Tuple[int | float, int]:
+    match = _JSON_NUM_RE.match(json, i)
+    # only a lone '-' can start a number but not match
+    end = match.end() if match is not None else i + 1
+    # the regex stops at the first character that can't continue the number, so if that is still a
+    # number character the number is malformed (e.g. '01', '1.', '.5', '1e', or '--1')
+    c = json[end:end+1]
+    if match is None or c in JSON_NUM_CHARS:
+        # a '-', decimal point, or exponent separator that the regex didn't take is missing its digits (e.g. '-x', '1.',
+        # or '1e+'), so point at where the first digit should be. A second decimal point or exponent separator
+        # (e.g. '1.5.3' or '1e5e') is the error itself, so that gets the generic error below.
+        if match is None:
+            digit_ind = end
+        else:
+            (fraction, exponent) = match.groups()
+            if c == '.' and fraction is None and exponent is None:
+                digit_ind = end + 1
+            elif c in ('e', 'E') and exponent is None:
+                digit_ind = end + 2 if json[end+1:end+2] in ('+', '-') else end + 1
+            else:
+                digit_ind = None
+        if digit_ind is not None:
+            digit = json[digit_ind:digit_ind+1]
+            if not digit:
+                raise SyntaxError(format_err_str(f"Unexpected end of number at position $position$. Expected a digit", json, digit_ind))
+            if not '0' <= digit <= '9':
+                raise SyntaxError(format_err_str(f"Unexpected character '{digit}' at position $position$. Expected a digit", json, digit_ind))
+        raise SyntaxError(format_err_str(f"Unexpected character '{c}' in number at position $position$", json, end))
+    (fraction, exponent) = match.groups()
+    # numbers without a fraction or exponent are integers
+    num = match.group()
+    return (_parse_json_int(num) if fraction is None and exponent is None else float(num), end)
 
 def skip_whitespace(json: str, i: int) -> int:
     """Moves the cursor (starting at position `i`) until it hits a non-whitespace character.
     It then returns the new position of the cursor.
     """
-    while i < len(json) and json[i] in JSON_WHITESPACE:
-        i += 1
-    return i
+    # in minified JSON there usually is no whitespace to skip, so check the first character before running the regex
+    if json[i:i+1] not in JSON_WHITESPACE:
+        return i
+    return _JSON_WHITESPACE_RE.match(json, i + 1).end()
 
 # Py -> JSON
 
+# Translation table (for str.translate) from the characters that have to be escaped in JSON strings as '\\uXXXX'
+# to their escape sequences: control characters without a short escape sequence and (lone) surrogates
+JSON_CTRL_ESCAPE_TABLE = {n: f"\\u{n:04x}" for n in (*range(0x20), *range(0xd800, 0xe000)) if chr(n) not in '\b\f\n\r\t'}
+_JSON_ESCAPE_NEEDED_RE = re.compile(r'[\\"\x00-\x1f\ud800-\udfff]')
+_JSON_CTRL_ESCAPE_NEEDED_RE = re.compile(r'[\x00-\x08\x0b\x0e-\x1f\ud800-\udfff]')
+
 def increase_indent(text: str, spaces: str) -> str:
     """Inserts the `spaces` string after each newline in `text`."""
     return text.replace("\n", "\n" + spaces)
 
 def escape_str_for_json(string: str) -> str:
     """Formats and escapes characters in a Python string and returns it in the correct format for JSON."""
+    # short strings (keys, enum-like values) are cached since they tend to be repeated many times in the same document,
+    # long ones aren't so that they can't push the short ones out of the cache
+    if len(string) <= 64:
+        return _escape_short_str_for_json(string)
+    return _escape_str_for_json(string)
+
+@lru_cache(maxsize=4096)
+def _escape_short_str_for_json(string: str) -> str:
+    return _escape_str_for_json(string)
+
+def _escape_str_for_json(string: str) -> str:
+    # most strings don't contain anything that has to be escaped
+    if _JSON_ESCAPE_NEEDED_RE.search(string) is None:
+        return f'"{string}"'
     string = string.replace('\\', '\\\\').replace('"', '\\"')
     string = string.replace('\n', '\\n').replace('\r', '\\r').replace('\b', '\\b').replace('\t', '\\t').replace('\f', '\\f')
-
-    char_arr = []
-    for char in string:
-        n = ord(char)
-        if n <= 0x1f or (n >= 0xd800 and n <= 0xdfff):
-            char_arr.append(f"\\u{hex(n)[2:].rjust(4, '0')}")
-        else:
-            char_arr.append(char)
-    return f'"{"".join(char_arr)}"'
+    # str.translate is only fast until it hits the first character it has to replace, so it's only used for
+    # the rare characters that don't have a short escape sequence (which replace() handles in C-speed passes)
+    if _JSON_CTRL_ESCAPE_NEEDED_RE.search(string) is not None:
+        string = string.translate(JSON_CTRL_ESCAPE_TABLE)
+    return f'"{string}"'
 
 def to_json(data: dict | list | str | int | float | bool | None, spaces: str | int = None) -> str:
     """Converts `data` to a JSON string, using the specified amount of spaces (or no spacing, if `None` is provided).
@@ -271,58 +319,72 @@ def to_json(data: dict | list | str | int | float | bool | None, spaces: str | i
     Can only convert dict, list, str, int, float, bool, and None values into JSON.
     """
     if isinstance(spaces, int): spaces = ' ' * spaces
+    key_sep = ':' if spaces is None else ': '
+    isfinite = math.isfinite
+
+    str_arr = []
+    # Everything that still has to be written, in reverse order (so that the next item is at the end).
+    # Strings are written as they are, while (value, depth) tuples still have to be converted.
+    stack = [(data, 0)]
+    # The ids of the objects and arrays enclosing the current value, by depth, and the same ids as a set
+    # for constant-time lookups (used to detect circular references)
+    parents = []
+    parent_ids = set()
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            str_arr.append(item)
+            continue
+        (data, depth) = item
+
+        if data is None: str_arr.append('null') # None/null values
+        elif isinstance(data, str): str_arr.append(escape_str_for_json(data)) # strings
+        elif isinstance(data, bool): str_arr.append('true' if data else 'false') # booleans
+        elif isinstance(data, int): str_arr.append(int.__repr__(data)) # integers (bools are handled above)
+        elif isinstance(data, float): # other numbers
+            if not isfinite(data):
+                raise TypeError(f"Cannot convert the value 'inf' or 'nan' to a JSON number")
+            num = float.__repr__(data)
+            if num.endswith('.0'): num = num[:-2] # save a bit of space by chopping off the decimal point if it was added unnecessarily
+            str_arr.append(num)
+        elif isinstance(data, dict) or isinstance(data, list): # objects and arrays
+            if len(data) == 0: # empty
+                str_arr.append('{}' if isinstance(data, dict) else '[]')
+                continue
+            # every id is added and removed once, so keeping the set in sync doesn't depend on the depth
+            parent_ids.difference_update(parents[depth:])
+            del parents[depth:]
+            if id(data) in parent_ids:
+                raise ValueError("Cannot convert a circular reference to JSON")
+            parents.append(id(data))
+            parent_ids.add(id(data))
+
+            # line breaks in between elements are only added if spaces is not None,
+            # and each element is indented one level further than the enclosing object or array
+            if spaces is None:
+                (item_start, end) = ('', '')
+            else:
+                (item_start, end) = ('\n' + spaces * (depth + 1), '\n' + spaces * depth)
+            # every comma must have at least one element before and after it, so the first element doesn't get one
+            sep = item_start
+            items = []
+            if isinstance(data, dict):
+                str_arr.append('{')
+                for (key, val) in data.items():
+                    items.append(sep + escape_str_for_json(key) + key_sep)
+                    items.append((val, depth + 1))
+                    sep = ',' + item_start
+                items.append(end + '}')
+            else:
+                str_arr.append('[')
+                for val in data:
+                    items.append(sep)
+                    items.append((val, depth + 1))
+                    sep = ',' + item_start
+                items.append(end + ']')
+            items.reverse()
+            stack.extend(items)
+        else:
+            raise TypeError(f"Argument 'data' must be a dict, list, int, float, str, bool, or None, not '{type(data).__name__}'")
 
-    if data is None: return 'null' # None/null values
-    elif isinstance(data, str): return escape_str_for_json(data) # strings
-    elif isinstance(data, bool): return 'true' if data else 'false' # booleans
-    elif isinstance(data, int) or isinstance(data, float): # numbers
-        if not math.isfinite(data):
-            raise TypeError(f"Cannot convert the value 'inf' or 'nan' to a JSON number")
-        num = str(data)
-        if num.endswith('.0'): num = num[:-2] # save a bit of space by chopping off the decimal point if it was added unnecessarily
-        return num
-    elif isinstance(data, dict): # objects
-        keys = data.keys()
-        if len(keys) == 0: return '{}' # empty
-        str_arr = ['{']
-        is_first = True
-        for key in keys:
-            # every comma must have at least one element before and after it
-            if is_first: is_first = False
-            else: str_arr.append(',')
-            if spaces is not None: # line break in between elements is only added if spaces is not None
-                str_arr.append('\n')
-                str_arr.append(spaces)
-            str_arr.append(escape_str_for_json(key))
-            str_arr.append(':')
-
-            if spaces is not None: str_arr.append(' ')
-
-            stringified = to_json(data[key], spaces)
-            str_arr.append(stringified if spaces is None else increase_indent(stringified, spaces))
-
-        if spaces is not None: str_arr.append('\n')
-
-        str_arr.append('}')
-        return ''.join(str_arr)
-    elif isinstance(data, list): # arrays
-        if len(data) == 0: return '[]' # empty
-        str_arr = ['[']
-        is_first = True
-        for val in data:
-            # every comma must have at least one element before and after it
-            if is_first: is_first = False
-            else: str_arr.append(',')
-            if spaces is not None: # line break in between elements is only added if spaces is not None
-                str_arr.append('\n')
-                str_arr.append(spaces)
-
-            stringified = to_json(val, spaces)
-            str_arr.append(stringified if spaces is None else increase_indent(stringified, spaces))
-
-        if spaces is not None: str_arr.append('\n')
-
-        str_arr.append(']')
-        return ''.join(str_arr)
-    else:
-        raise TypeError(f"Argument 'data' must be a dict, list, int, float, str, bool, or None, not '{type(data).__name__}'")
+    return ''.join(str_arr)